@@ -1,14 +1,16 @@
 #!/usr/bin/env python3
 import os
+import array
 import asyncio
+import contextlib
 import aiohttp
-import json
+import msgspec
+import orjson
 import time
 import math
 import hmac
 import hashlib
-from collections import deque
-from decimal import Decimal, ROUND_DOWN
+from decimal import Decimal
 from dotenv import load_dotenv
 import signal
 
@@ -27,46 +29,142 @@ MIN_ORDER_NOTIONAL = float(os.getenv("MIN_ORDER_NOTIONAL", "5"))
 TICK_SIZE = float(os.getenv("TICK_SIZE", "0.0001"))
 QTY_STEP = float(os.getenv("QTY_STEP", "0.001"))
 MAX_POSITION = float(os.getenv("MAX_POSITION", "1000"))
-ORDER_REFRESH_SECONDS = 2
+ORDER_REFRESH_SECONDS = 2  # fallback refresh when the book is quiet
+MIN_REFRESH_SECONDS = 0.25  # debounce between refreshes triggered by book updates
+MAX_QUOTE_AGE_SECONDS = 5 * ORDER_REFRESH_SECONDS  # force cancel/replace of an unchanged quote
+
+_API_BASE = API_BASE.rstrip("/")
+
+# Step multiples are floored after rounding to 6 places in step units, so
+# on-grid inputs whose product lands a hair below the integer are not
+# dropped a whole step. The result is then rounded to the step's decimal
+# places to strip float noise before it goes on the wire.
+_INV_TICK = 1.0 / TICK_SIZE
+_INV_QTY = 1.0 / QTY_STEP
+_TICK_DECIMALS = max(0, -Decimal(repr(TICK_SIZE)).as_tuple().exponent)
+_QTY_DECIMALS = max(0, -Decimal(repr(QTY_STEP)).as_tuple().exponent)
 
 def round_price(p):
-    return float((Decimal(str(p)) / Decimal(str(TICK_SIZE))).quantize(0, ROUND_DOWN) * Decimal(str(TICK_SIZE)))
+    return round(math.floor(round(p * _INV_TICK, 6)) * TICK_SIZE, _TICK_DECIMALS)
 
 def round_qty(q):
-    return float((Decimal(str(q)) / Decimal(str(QTY_STEP))).quantize(0, ROUND_DOWN) * Decimal(str(QTY_STEP)))
+    return round(math.floor(round(q * _INV_QTY, 6)) * QTY_STEP, _QTY_DECIMALS)
+
+class Trade(msgspec.Struct, tag_field="type", tag="trade"):
+    ts: float  # RollingVolume buckets by int(ts); fractional stamps must still decode
+    quantity: float
+
+class Orderbook(msgspec.Struct, tag_field="type", tag="orderbook"):
+    bestBid: float
+    bestAsk: float
+
+# strict=False lets exchanges that quote numbers as strings decode too
+_market_decoder = msgspec.json.Decoder(Trade | Orderbook, strict=False)
 
 class RollingVolume:
     def __init__(self, window_seconds):
         self.window = window_seconds
-        self.trades = deque()
+        self.buckets = array.array('d', [0.0]) * window_seconds
+        self.last_ts = None
         self.base_volume = 0.0
 
-    def add_trade(self, ts, qty, price):
-        self.trades.append((ts, qty, price))
+    def add_trade(self, ts, qty):
+        ts = int(ts)
+        if self.last_ts is None:
+            self.last_ts = ts
+        elif ts > self.last_ts:
+            self._evict_old(ts)
+        elif ts <= self.last_ts - self.window:
+            return  # late trade already outside the window
+        self.buckets[ts % self.window] += qty
         self.base_volume += qty
-        self._evict_old(ts)
 
     def _evict_old(self, now):
-        cutoff = now - self.window
-        while self.trades and self.trades[0][0] < cutoff:
-            _, qty, _ = self.trades.popleft()
-            self.base_volume -= qty
+        window = self.window
+        if now - self.last_ts >= window:
+            self.buckets = array.array('d', [0.0]) * window
+            self.base_volume = 0.0
+        else:
+            buckets = self.buckets
+            for t in range(self.last_ts + 1, now + 1):
+                i = t % window
+                self.base_volume -= buckets[i]
+                buckets[i] = 0.0
+        self.last_ts = now
 
     def total_volume(self):
         return self.base_volume
 
+def quote_prices(mid):
+    """Return the rounded (buy_price, sell_price) straddling mid"""
+    return round_price(mid * (1 - SPREAD_PCT/2)), round_price(mid * (1 + SPREAD_PCT/2))
+
+def compute_sizes(mid, market_vol, position):
+    """Return (buy_qty, sell_qty) for the given market state"""
+    if market_vol <= 0:
+        max_order_base = MIN_ORDER_NOTIONAL / mid
+    else:
+        desired_base_per_window = TARGET_VOLUME_SHARE * market_vol
+        expected_fill_rate = 0.2
+        expected_needed_base = desired_base_per_window * expected_fill_rate
+        max_order_base = expected_needed_base / 2.0
+
+    order_notional = min(MAX_ORDER_NOTIONAL, max(MIN_ORDER_NOTIONAL, max_order_base * mid))
+    order_qty = round_qty(order_notional / mid)
+    if order_qty * mid < MIN_ORDER_NOTIONAL:
+        order_qty = round_qty(MIN_ORDER_NOTIONAL / mid)
+
+    if position + order_qty > MAX_POSITION:
+        buy_qty = max(0.0, round_qty(MAX_POSITION - position))
+    else:
+        buy_qty = order_qty
+    if position - order_qty < -MAX_POSITION:
+        sell_qty = max(0.0, round_qty(position + MAX_POSITION))
+    else:
+        sell_qty = order_qty
+
+    return buy_qty, sell_qty
+
 class MMBot:
     def __init__(self, session):
         self.session = session
         self.volume = RollingVolume(VOLUME_WINDOW)
-        self.order_ids = {}
+        self.open_oids = []
         self.position = 0.0
         self.last_mid = None
-        self.http_sem = asyncio.Semaphore(10)
+        self._cached_buy = None
+        self._cached_sell = None
+        self._last_quote = None
+        self._quoted_at = 0.0
+        self._tick = asyncio.Event()
+        self._http_active = 0
+        self._http_limit = 10
+        self._http_cond = asyncio.Condition()
         self.running = True
         self.api_key = API_KEY
         self.api_secret = API_SECRET  # Store the secret
+        self._headers_json = {"X-API-KEY": self.api_key, "Content-Type": "application/json"}
+        self._headers_plain = {"X-API-KEY": self.api_key}
+        self._dispatch = {Trade: self.on_trade, Orderbook: self.on_orderbook}
     
+    async def set_http_limit(self, limit):
+        """Resize REST concurrency at runtime (e.g. to back off on 429s)"""
+        async with self._http_cond:
+            self._http_limit = limit
+            self._http_cond.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def _http_slot(self):
+        async with self._http_cond:
+            await self._http_cond.wait_for(lambda: self._http_active < self._http_limit)
+            self._http_active += 1
+        try:
+            yield
+        finally:
+            async with self._http_cond:
+                self._http_active -= 1
+                self._http_cond.notify(1)
+
     def generate_signature(self, timestamp, method, path, body=""):
         """Generate HMAC SHA256 signature"""
         message = f"{timestamp}{method}{path}{body}"
@@ -75,66 +173,55 @@ class MMBot:
         return signature
     
     async def rest_post(self, path, payload):
-        url = API_BASE.rstrip("/") + path
+        url = _API_BASE + path
         timestamp = str(int(time.time() * 1000))  # milliseconds
-        body = json.dumps(payload) if payload else ""
+        body = orjson.dumps(payload) if payload else b""
         
-        # Generate signature
-        signature = self.generate_signature(timestamp, "POST", path, body)
+        # Generate signature over the exact bytes we send
+        signature = self.generate_signature(timestamp, "POST", path, body.decode())
         
-        headers = {
-            "X-API-KEY": self.api_key,
-            "X-TIMESTAMP": timestamp,
-            "X-SIGNATURE": signature,
-            "Content-Type": "application/json"
-        }
+        headers = {**self._headers_json, "X-TIMESTAMP": timestamp, "X-SIGNATURE": signature}
         
         print(f"DEBUG POST: {path}, timestamp: {timestamp}, sig: {signature[:10]}...")
         
-        async with self.http_sem:
-            async with self.session.post(url, json=payload, headers=headers, timeout=10) as resp:
-                text = await resp.text()
+        async with self._http_slot():
+            async with self.session.post(url, data=body, headers=headers, timeout=10) as resp:
+                raw = await resp.read()
                 if resp.status >= 400:
-                    raise Exception(f"POST {url} -> {resp.status}: {text}")
-                return await resp.json()
+                    raise Exception(f"POST {url} -> {resp.status}: {raw.decode(errors='replace')}")
+                return orjson.loads(raw)
     
     async def rest_delete(self, path):
-        url = API_BASE.rstrip("/") + path
+        url = _API_BASE + path
         timestamp = str(int(time.time() * 1000))
         body = ""
         
         # Generate signature
         signature = self.generate_signature(timestamp, "DELETE", path, body)
         
-        headers = {
-            "X-API-KEY": self.api_key,
-            "X-TIMESTAMP": timestamp,
-            "X-SIGNATURE": signature
-        }
+        headers = {**self._headers_plain, "X-TIMESTAMP": timestamp, "X-SIGNATURE": signature}
         
         print(f"DEBUG DELETE: {path}, timestamp: {timestamp}, sig: {signature[:10]}...")
         
-        async with self.http_sem:
+        async with self._http_slot():
             async with self.session.delete(url, headers=headers, timeout=10) as resp:
-                text = await resp.text()
+                raw = await resp.read()
                 if resp.status >= 400:
-                    raise Exception(f"DELETE {url} -> {resp.status}: {text}")
-                return await resp.json()
+                    raise Exception(f"DELETE {url} -> {resp.status}: {raw.decode(errors='replace')}")
+                return orjson.loads(raw)
     
     async def on_trade(self, trade):
-        ts = trade["ts"]
-        qty = float(trade["quantity"])
-        price = float(trade["price"])
-        self.volume.add_trade(ts, qty, price)
+        self.volume.add_trade(trade.ts, trade.quantity)
     
     async def on_orderbook(self, ob):
-        best_bid = float(ob["bestBid"])
-        best_ask = float(ob["bestAsk"])
-        self.last_mid = (best_bid + best_ask) / 2.0
+        mid = (ob.bestBid + ob.bestAsk) / 2.0
+        if mid != self.last_mid:
+            self.last_mid = mid
+            self._cached_buy, self._cached_sell = quote_prices(mid)
+            self._tick.set()
     
     async def place_limit(self, side, price, qty):
-        price = round_price(price)
-        qty = round_qty(qty)
+        # price and qty arrive already rounded by quote_prices/compute_sizes
         if qty <= 0:
             return None
         payload = {
@@ -166,49 +253,34 @@ class MMBot:
             return
 
         market_vol = self.volume.total_volume()
-        if market_vol <= 0:
-            max_order_base = MIN_ORDER_NOTIONAL / self.last_mid
-        else:
-            desired_base_per_window = TARGET_VOLUME_SHARE * market_vol
-            expected_fill_rate = 0.2
-            expected_needed_base = desired_base_per_window * expected_fill_rate
-            max_order_base = expected_needed_base / 2.0
-
-        order_notional = min(MAX_ORDER_NOTIONAL, max(MIN_ORDER_NOTIONAL, max_order_base * self.last_mid))
-        order_qty = round_qty(order_notional / self.last_mid)
-        if order_qty * self.last_mid < MIN_ORDER_NOTIONAL:
-            order_qty = round_qty(MIN_ORDER_NOTIONAL / self.last_mid)
+        buy_qty, sell_qty = compute_sizes(self.last_mid, market_vol, self.position)
+        buy_price, sell_price = self._cached_buy, self._cached_sell
 
-        spread = SPREAD_PCT
-        buy_price = round_price(self.last_mid * (1 - spread/2))
-        sell_price = round_price(self.last_mid * (1 + spread/2))
-
-        if self.position + order_qty > MAX_POSITION:
-            buy_qty = max(0.0, round_qty(MAX_POSITION - self.position))
-        else:
-            buy_qty = order_qty
-        if self.position - order_qty < -MAX_POSITION:
-            sell_qty = max(0.0, round_qty(self.position + MAX_POSITION))
-        else:
-            sell_qty = order_qty
+        # Leave resting orders alone if they already match the target quote.
+        # The API has no order-status endpoint, so fills go unnoticed here: a
+        # filled leg is only replaced once the quote changes or ages out.
+        target = (buy_price, buy_qty, sell_price, sell_qty)
+        if (target == self._last_quote and self.open_oids
+                and time.monotonic() - self._quoted_at < MAX_QUOTE_AGE_SECONDS):
+            return
 
-        remote_ids = list(self.order_ids.values())
-        for oid in remote_ids:
-            await self.cancel_order(oid)
-        self.order_ids.clear()
+        await asyncio.gather(*[self.cancel_order(oid) for oid in self.open_oids], return_exceptions=True)
+        self.open_oids.clear()
 
+        placements = []
         if buy_qty * self.last_mid >= MIN_ORDER_NOTIONAL:
-            r = await self.place_limit("buy", buy_price, buy_qty)
-            if r and "id" in r:
-                self.order_ids[f"buy_{int(time.time())}"] = r["id"]
-
+            placements.append(self.place_limit("buy", buy_price, buy_qty))
         if sell_qty * self.last_mid >= MIN_ORDER_NOTIONAL:
-            r = await self.place_limit("sell", sell_price, sell_qty)
+            placements.append(self.place_limit("sell", sell_price, sell_qty))
+
+        for r in await asyncio.gather(*placements):
             if r and "id" in r:
-                self.order_ids[f"sell_{int(time.time())}"] = r["id"]
+                self.open_oids.append(r["id"])
+        # Only remember the quote if every leg made it, so a failed leg is retried
+        self._last_quote = target if len(self.open_oids) == len(placements) else None
+        self._quoted_at = time.monotonic()
     
     async def ws_consume(self):
-        import websockets
         import urllib.parse
         
         # Add API key as query parameter instead of header
@@ -221,26 +293,44 @@ class MMBot:
         print(f"Connecting to WebSocket: {ws_url_with_key}")
         
         try:
-            async with websockets.connect(
-                ws_url_with_key,
-                ping_interval=30,
-                ping_timeout=30
-            ) as ws:
+            async with self.session.ws_connect(ws_url_with_key, heartbeat=30) as ws:
                 subscribe = {
                     "type": "subscribe", 
                     "symbol": SYMBOL, 
                     "channels": ["trades", "orderbook"]
                 }
-                await ws.send(json.dumps(subscribe))
+                await ws.send_json(subscribe)
                 print("WebSocket connected and subscribed")
                 
-                while self.running:
-                    msg = await ws.recv()
-                    data = json.loads(msg)
-                    if data.get("type") == "trade":
-                        await self.on_trade(data)
-                    elif data.get("type") == "orderbook":
-                        await self.on_orderbook(data)
+                try:
+                    # Hot loop: bind lookups to locals once
+                    decode = _market_decoder.decode
+                    dispatch = self._dispatch
+                    data_types = (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY)
+                    validation_error = msgspec.ValidationError
+                    async for msg in ws:
+                        if not self.running:
+                            break
+                        if msg.type in data_types:
+                            try:
+                                event = decode(msg.data)
+                            except validation_error:
+                                continue  # control frames such as the subscribe ack
+                            await dispatch[type(event)](event)
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            raise ws.exception() or ConnectionError("WebSocket error frame")
+                finally:
+                    # close() waits for the server's CLOSE frame and its timeout
+                    # restarts on every frame received, so a feed that keeps
+                    # pushing data can stall it indefinitely; bound it and let
+                    # cancellation drop the connection instead.
+                    try:
+                        await asyncio.wait_for(ws.close(), 5)
+                    except asyncio.TimeoutError:
+                        pass
+            # The server closed the stream; reconnect like on an error
+            if self.running:
+                raise ConnectionError("WebSocket closed by server")
                         
         except Exception as e:
             print(f"WebSocket error: {e}")
@@ -250,11 +340,18 @@ class MMBot:
     
     async def bot_loop(self):
         while self.running:
+            # Wake on a mid change, or periodically so volume changes and failed legs are picked up
+            try:
+                await asyncio.wait_for(self._tick.wait(), ORDER_REFRESH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._tick.clear()
             try:
                 await self.compute_and_place()
             except Exception as e:
                 print("error in compute_and_place:", e)
-            await asyncio.sleep(ORDER_REFRESH_SECONDS)
+            # Updates arriving meanwhile leave the event set and trigger the next cycle
+            await asyncio.sleep(MIN_REFRESH_SECONDS)
 
 async def main():
     # Debug: print environment variables
@@ -266,7 +363,8 @@ async def main():
     print(f"SYMBOL: {SYMBOL}")
     print("===================")
     
-    async with aiohttp.ClientSession() as sess:
+    connector = aiohttp.TCPConnector(limit=200, limit_per_host=100, ttl_dns_cache=300, keepalive_timeout=60)
+    async with aiohttp.ClientSession(connector=connector, json_serialize=lambda o: orjson.dumps(o).decode()) as sess:
         bot = MMBot(sess)
         ws_task = asyncio.create_task(bot.ws_consume())
         bot_task = asyncio.create_task(bot.bot_loop())
@@ -280,6 +378,11 @@ async def main():
             bot.running = False
 
 if __name__ == "__main__":
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -1,42 +1,48 @@
 # Simple mock exchange with HMAC verification and websockets for market data
 import asyncio
-import hmac, hashlib, json, time
+import hmac, itertools, time
+import orjson
 from aiohttp import web, WSMsgType
 
 API_KEYS = {
     "testkey": "testsecret"
 }
 
+API_KEYS_ENC = {k: s.encode() for k, s in API_KEYS.items()}
+
 def verify_signature(api_key, timestamp, signature, method, path, body):
-    secret = API_KEYS.get(api_key)
+    secret = API_KEYS_ENC.get(api_key)
     if not secret:
         return False
-    message = f"{timestamp}{method}{path}{body}"
-    expected = hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+    # body is the raw request bytes; hash it as received instead of decoding and re-encoding
+    message = b"".join((f"{timestamp}{method}{path}".encode(), body))
+    expected = hmac.digest(secret, message, 'sha256').hex()
     return hmac.compare_digest(expected, signature)
 
 async def handle_balance(request):
     api_key = request.headers.get("X-API-KEY")
     ts = request.headers.get("X-TIMESTAMP", "")
     sig = request.headers.get("X-SIGNATURE", "")
-    body = ""
+    body = b""
     if not verify_signature(api_key, ts, sig, "GET", "/account/balance", body):
         return web.json_response({"error":"invalid signature"}, status=401)
     return web.json_response({"balances":[{"asset":"GHD","free":1000,"locked":0},{"asset":"USDT","free":10000,"locked":0}]})
 
 ORDERS = {}
-ORDER_ID_SEQ = 1
+_oid_seq = itertools.count(1)
+
+def next_oid():
+    return str(next(_oid_seq))
 
 async def handle_orders(request):
-    global ORDER_ID_SEQ
     api_key = request.headers.get("X-API-KEY")
     ts = request.headers.get("X-TIMESTAMP", "")
     sig = request.headers.get("X-SIGNATURE", "")
-    body = await request.text()
+    body = await request.read()
     if not verify_signature(api_key, ts, sig, "POST", "/orders", body):
         return web.json_response({"error":"invalid signature"}, status=401)
-    data = await request.json()
-    oid = str(ORDER_ID_SEQ); ORDER_ID_SEQ += 1
+    data = orjson.loads(body)
+    oid = next_oid()
     ORDERS[oid] = dict(id=oid, **data, executedQuantity=0, status="NEW")
     return web.json_response(ORDERS[oid], status=201)
 
@@ -45,7 +51,7 @@ async def handle_cancel(request):
     ts = request.headers.get("X-TIMESTAMP", "")
     sig = request.headers.get("X-SIGNATURE", "")
     oid = request.match_info['orderId']
-    body = ""
+    body = b""
     if not verify_signature(api_key, ts, sig, "DELETE", f"/orders/{oid}", body):
         return web.json_response({"error":"invalid signature"}, status=401)
     if oid in ORDERS:
@@ -67,6 +73,10 @@ async def orders(req):
 async def cancel(req):
     return await handle_cancel(req)
 
+# Synthetic market data frames; only the symbol and timestamp vary
+_OB_TMPL = b'{"type":"orderbook","symbol":%s,"bestBid":0.0995,"bestAsk":0.1005,"timestamp":%d}'
+_TRADE_TMPL = b'{"type":"trade","symbol":%s,"ts":%d,"price":0.1,"quantity":10.0}'
+
 async def ws_handler(request):
     ws = web.WebSocketResponse()
     await ws.prepare(request)
@@ -86,23 +96,23 @@ async def ws_handler(request):
     try:
         msg = await ws.receive(timeout=5.0)
         if msg.type == WSMsgType.TEXT:
-            data = json.loads(msg.data)
+            data = orjson.loads(msg.data)
             if data.get("type") == "subscribe":
                 symbol = data.get("symbol", "GHDUSDT")
                 channels = data.get("channels", ["trades", "orderbook"])
                 print(f"Subscribed to {symbol} channels: {channels}")
-                await ws.send_str(json.dumps({"type": "subscribed", "symbol": symbol}))
+                await ws.send_bytes(orjson.dumps({"type": "subscribed", "symbol": symbol}))
             else:
-                await ws.send_str(json.dumps({"error": "Expected subscribe message"}))
+                await ws.send_bytes(orjson.dumps({"error": "Expected subscribe message"}))
                 await ws.close()
                 return ws
         else:
-            await ws.send_str(json.dumps({"error": "Expected text message"}))
+            await ws.send_bytes(orjson.dumps({"error": "Expected text message"}))
             await ws.close()
             return ws
     except asyncio.TimeoutError:
         print("Timeout waiting for subscription")
-        await ws.send_str(json.dumps({"error": "Timeout waiting for subscription"}))
+        await ws.send_bytes(orjson.dumps({"error": "Timeout waiting for subscription"}))
         await ws.close()
         return ws
     except Exception as e:
@@ -110,25 +120,10 @@ async def ws_handler(request):
     
     # Main loop: send synthetic data
     try:
+        symbol_json = orjson.dumps(symbol)
         while True:
-            ob = {
-                "type": "orderbook",
-                "symbol": symbol,
-                "bestBid": 0.0995,
-                "bestAsk": 0.1005,
-                "timestamp": int(time.time() * 1000)
-            }
-            await ws.send_str(json.dumps(ob))
-            
-            trade = {
-                "type": "trade",
-                "symbol": symbol,
-                "ts": int(time.time()),
-                "price": 0.1000,
-                "quantity": 10.0
-            }
-            await ws.send_str(json.dumps(trade))
-            
+            await ws.send_bytes(_OB_TMPL % (symbol_json, int(time.time() * 1000)))
+            await ws.send_bytes(_TRADE_TMPL % (symbol_json, int(time.time())))
             await asyncio.sleep(1)
     except (asyncio.CancelledError, ConnectionResetError) as e:
         print(f"WebSocket disconnected: {e}")
@@ -141,4 +136,9 @@ app.add_routes(routes)
 app.router.add_get('/ws', ws_handler)
 
 if __name__ == '__main__':
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     web.run_app(app, port=9000)